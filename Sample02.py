@@ -1,14 +1,19 @@
 # Complete Streamlit Orders Dashboard with Forecast & Return Prediction
 
+import os
+import json
+import hashlib
+import tempfile
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objs as go
-from datetime import datetime
 from prophet import Prophet
 from sklearn.model_selection import train_test_split
-from xgboost import XGBClassifier
+import xgboost as xgb
 from sklearn.metrics import accuracy_score
+from preprocessing import load_data
+from charts import build_pie, build_bar, build_line
 
 # -------------------------------
 # 🎨 Dashboard Theme & Page Setup
@@ -32,20 +37,33 @@ st.markdown("""
 # Data Loading & Preprocessing
 # -------------------------------
 
-@st.cache_data
-def load_data():
-    df = pd.read_csv("orders_dataset.csv")
-    df['orderDate'] = pd.to_datetime(df['orderDate'], format='%d-%m-%Y', errors='coerce')
-    df['deliveryDate'] = pd.to_datetime(df['deliveryDate'], format='%Y-%m-%d', errors='coerce')
-    df['dateOfBirth'] = pd.to_datetime(df['dateOfBirth'], errors='coerce')
-    df['creationDate'] = pd.to_datetime(df['creationDate'], format='%d-%m-%Y', errors='coerce')
-    df['order_year_month'] = df['orderDate'].dt.to_period('M').astype(str)
-    df['delivery_delay'] = (df['deliveryDate'] - df['orderDate']).dt.days
-    df['customer_age'] = df['dateOfBirth'].apply(lambda dob: datetime.now().year - dob.year if pd.notnull(dob) else None)
-    df.fillna({'color': 'Unknown', 'size': 'Unknown', 'state': 'Unknown'}, inplace=True)
-    return df
-
-df = load_data()
+df, opts = load_data()
+
+# Cached as a shared, read-only frame: callers must not mutate df_filtered
+@st.cache_resource(max_entries=16)
+def filter_df(states_t, months_t, colors_t, sizes_t):
+    # An empty selection on any filter matches nothing
+    if not (states_t and months_t and colors_t and sizes_t):
+        return df.iloc[0:0]
+    mask = (
+        df['state'].isin(states_t) &
+        df['order_year_month'].isin(months_t) &
+        df['color'].isin(colors_t) &
+        df['size'].isin(sizes_t)
+    )
+    return df.loc[mask]
+
+@st.cache_data(max_entries=16)
+def compute_aggregates(states_t, months_t, colors_t, sizes_t):
+    df_filtered = filter_df(states_t, months_t, colors_t, sizes_t)
+    df_delays = df_filtered[df_filtered['delivery_delay'] > 0]
+    return {
+        'color_counts': df_filtered.groupby('color', observed=True).size().sort_values(ascending=False),
+        'size_counts': df_filtered.groupby('size', observed=True).size().sort_values(ascending=False),
+        'manufacturer_rev': df_filtered.groupby('manufacturerID', observed=True)['price'].sum().sort_values(ascending=False),
+        'delays_by_month': df_delays.groupby('order_month')['delivery_delay'].mean(),
+        'returns_by_state': df_filtered.groupby('state', observed=True)['returnShipment'].mean() * 100,
+    }
 
 # -------------------------------
 # Sidebar Filters
@@ -53,17 +71,14 @@ df = load_data()
 
 st.sidebar.header("🔍 Filters")
 
-states = st.sidebar.multiselect("State", df['state'].unique(), default=df['state'].unique())
-months = st.sidebar.multiselect("Order Month", sorted(df['order_year_month'].unique()), default=df['order_year_month'].unique())
-colors = st.sidebar.multiselect("Color", df['color'].unique(), default=df['color'].unique())
-sizes = st.sidebar.multiselect("Size", df['size'].unique(), default=df['size'].unique())
+states = st.sidebar.multiselect("State", opts['states'], default=opts['states'])
+months = st.sidebar.multiselect("Order Month", opts['months'], default=opts['months'])
+colors = st.sidebar.multiselect("Color", opts['colors'], default=opts['colors'])
+sizes = st.sidebar.multiselect("Size", opts['sizes'], default=opts['sizes'])
 
-df_filtered = df[
-    (df['state'].isin(states)) &
-    (df['order_year_month'].isin(months)) &
-    (df['color'].isin(colors)) &
-    (df['size'].isin(sizes))
-]
+filter_key = (tuple(sorted(states)), tuple(sorted(months)), tuple(sorted(colors)), tuple(sorted(sizes)))
+df_filtered = filter_df(*filter_key)
+aggs = compute_aggregates(*filter_key)
 
 # -------------------------------
 # KPIs
@@ -78,6 +93,10 @@ kpi2.metric("Total Revenue", f"€{df_filtered['price'].sum():,.2f}")
 kpi3.metric("Avg Order Value", f"€{df_filtered['price'].mean():.2f}" if len(df_filtered) > 0 else "€0.00")
 kpi4.metric("Return Rate", f"{(df_filtered['returnShipment'].mean() * 100):.2f}%" if len(df_filtered) > 0 else "0.00%")
 
+if df_filtered.empty:
+    st.warning("No orders match the selected filters.")
+    st.stop()
+
 # -------------------------------
 # 📊 Charts
 # -------------------------------
@@ -86,29 +105,31 @@ st.subheader("🟣 Product Insights")
 col1, col2 = st.columns(2)
 
 with col1:
-    fig1 = px.pie(df_filtered, names='color', title="Orders by Color")
-    st.plotly_chart(fig1, use_container_width=True)
+    color_counts = aggs['color_counts']
+    fig1 = build_pie(tuple(color_counts.values), tuple(color_counts.index), "Orders by Color")
+    st.plotly_chart(go.Figure(fig1), use_container_width=True)
 
 with col2:
-    fig2 = px.bar(df_filtered['size'].value_counts().reset_index(), x='index', y='size', title="Orders by Size",
-                  labels={'index': 'Size', 'size': 'Count'})
-    st.plotly_chart(fig2, use_container_width=True)
+    size_counts = aggs['size_counts']
+    fig2 = build_bar(tuple(size_counts.index), tuple(size_counts.values), "Orders by Size",
+                     labels={'x': 'Size', 'y': 'Count'})
+    st.plotly_chart(go.Figure(fig2), use_container_width=True)
 
 st.subheader("🟢 Manufacturer & Delivery Insights")
 col3, col4 = st.columns(2)
 
 with col3:
-    rev_manufacturer = df_filtered.groupby('manufacturerID')['price'].sum().sort_values(ascending=False)
-    fig3 = px.bar(rev_manufacturer, title="Revenue by Manufacturer")
-    st.plotly_chart(fig3, use_container_width=True)
+    rev_manufacturer = aggs['manufacturer_rev']
+    fig3 = build_bar(tuple(rev_manufacturer.index), tuple(rev_manufacturer.values), "Revenue by Manufacturer",
+                     labels={'x': 'Manufacturer ID', 'y': 'Revenue'})
+    st.plotly_chart(go.Figure(fig3), use_container_width=True)
 
 with col4:
-    df_delays = df_filtered[df_filtered['delivery_delay'] > 0]
-    if not df_delays.empty:
-        delays = df_delays.groupby(df_delays['orderDate'].dt.month)['delivery_delay'].mean()
-        fig4 = px.line(x=delays.index, y=delays.values, title="Avg Delivery Delay by Month",
-                       labels={'x': 'Month', 'y': 'Avg Delay (days)'})
-        st.plotly_chart(fig4, use_container_width=True)
+    delays = aggs['delays_by_month']
+    if not delays.empty:
+        fig4 = build_line(tuple(delays.index), tuple(delays.values), "Avg Delivery Delay by Month",
+                          labels={'x': 'Month', 'y': 'Avg Delay (days)'})
+        st.plotly_chart(go.Figure(fig4), use_container_width=True)
     else:
         st.info("No delivery delay data available.")
 
@@ -117,9 +138,10 @@ with col4:
 # -------------------------------
 
 st.subheader("🔴 Return Rate by State")
-returns = df_filtered.groupby('state')['returnShipment'].mean() * 100
-fig5 = px.bar(returns, title="Return Rate by State")
-st.plotly_chart(fig5, use_container_width=True)
+returns = aggs['returns_by_state']
+fig5 = build_bar(tuple(returns.index), tuple(returns.values), "Return Rate by State",
+                 labels={'x': 'State', 'y': 'Return Rate (%)'})
+st.plotly_chart(go.Figure(fig5), use_container_width=True)
 
 # -------------------------------
 # 🎯 Time Series Forecast (Prophet)
@@ -127,15 +149,20 @@ st.plotly_chart(fig5, use_container_width=True)
 
 st.header("📈 Interactive Time Series Forecasting (Orders)")
 
+# Plot the point forecast only; uncertainty_samples=0 skips Prophet's posterior sampling in predict()
+@st.cache_resource(max_entries=16)
+def fit_prophet(forecast_hash, _df_forecast):
+    model = Prophet(uncertainty_samples=0)
+    model.fit(_df_forecast)
+    future = model.make_future_dataframe(periods=30)
+    return model, model.predict(future)
+
 df_forecast = df_filtered.groupby('orderDate').size().reset_index(name='orders')
 df_forecast.rename(columns={'orderDate': 'ds', 'orders': 'y'}, inplace=True)
 
 if len(df_forecast) > 30:
-    model = Prophet()
-    model.fit(df_forecast)
-    future = model.make_future_dataframe(periods=30)
-    forecast = model.predict(future)
-    fig6 = plot_plotly = plotly.graph_objs.Figure()
+    forecast_hash = hashlib.md5(pd.util.hash_pandas_object(df_forecast, index=False).values).hexdigest()
+    model, forecast = fit_prophet(forecast_hash, df_forecast)
     fig6 = model.plot(forecast)
     st.pyplot(fig6)
 else:
@@ -147,34 +174,80 @@ else:
 
 st.header("🤖 Return Prediction Model")
 
+MODEL_PATH = "return_xgb.ubj"
+MAX_TRAIN_ROWS = 100_000
+XGB_PARAMS = {'objective': 'binary:logistic', 'tree_method': 'hist'}
+NUM_BOOST_ROUND = 100
+
+@st.cache_resource(max_entries=16)
+def train_return_model(data_hash, _X, _y):
+    X_train, X_test, y_train, y_test = train_test_split(_X, _y, test_size=0.2, random_state=42)
+    train_config = json.dumps({'params': XGB_PARAMS, 'num_boost_round': NUM_BOOST_ROUND}, sort_keys=True)
+
+    # Reuse the booster saved on disk if it was trained on the same data and settings
+    # (a corrupt or incompatible file just falls through to retraining)
+    if os.path.exists(MODEL_PATH):
+        try:
+            booster = xgb.Booster(model_file=MODEL_PATH)
+            if booster.attr('data_hash') == data_hash and booster.attr('train_config') == train_config:
+                return booster, X_test, y_test
+        except xgb.core.XGBoostError:
+            pass
+
+    # Build the DMatrix straight from the float32 arrays and train with the native API
+    dtrain = xgb.DMatrix(X_train.to_numpy(), label=y_train.to_numpy(), feature_names=list(_X.columns))
+    booster = xgb.train(XGB_PARAMS, dtrain, num_boost_round=NUM_BOOST_ROUND)
+    booster.set_attr(data_hash=data_hash, train_config=train_config)
+
+    # Write to a temp file next to MODEL_PATH and swap it in atomically, so
+    # concurrent sessions never read a half-written model
+    fd, tmp_path = tempfile.mkstemp(suffix='.ubj', dir=os.path.dirname(os.path.abspath(MODEL_PATH)))
+    os.close(fd)
+    try:
+        booster.save_model(tmp_path)
+        os.replace(tmp_path, MODEL_PATH)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return booster, X_test, y_test
+
 # Prepare simple model
 features = ['price', 'delivery_delay', 'customer_age']
-df_model = df_filtered.dropna(subset=features + ['returnShipment'])
+df_model = df_filtered[features + ['returnShipment']].dropna()
 
-X = df_model[features]
-y = df_model['returnShipment']
+# Cap large selections with a sample stratified on the label to bound training time
+if len(df_model) > MAX_TRAIN_ROWS:
+    df_model = df_model.groupby('returnShipment').sample(frac=MAX_TRAIN_ROWS / len(df_model), random_state=42)
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# Downcast only the model features; price stays float64 in df so the revenue KPIs sum exactly
+X = df_model[features].astype(np.float32)
+y = df_model['returnShipment']
 
-model_xgb = XGBClassifier()
-model_xgb.fit(X_train, y_train)
+data_hash = hashlib.md5(pd.util.hash_pandas_object(df_model, index=False).values).hexdigest()
+booster, X_test, y_test = train_return_model(data_hash, X, y)
 
-y_pred = model_xgb.predict(X_test)
+# Predict straight from the booster on a float32 array, skipping the DMatrix build
+y_proba = booster.inplace_predict(X_test.to_numpy(dtype=np.float32))
+y_pred = (y_proba > 0.5).astype(int)
 acc = accuracy_score(y_test, y_pred)
 
 st.success(f"Return Prediction Model Accuracy: {acc*100:.2f}%")
 
 # Optional: Display feature importance
-importance = model_xgb.feature_importances_
-fig7 = px.bar(x=features, y=importance, title="Feature Importance for Return Prediction")
-st.plotly_chart(fig7, use_container_width=True)
+# Normalized gain, as reported by XGBClassifier.feature_importances_
+scores = booster.get_score(importance_type='gain')
+importance = np.array([scores.get(f, 0.0) for f in features])
+if importance.sum() > 0:
+    importance = importance / importance.sum()
+fig7 = build_bar(tuple(features), tuple(importance), "Feature Importance for Return Prediction")
+st.plotly_chart(go.Figure(fig7), use_container_width=True)
 
 # -------------------------------
 # 🟡 Detailed Data Table
 # -------------------------------
 
 st.subheader("📄 Sample Order Records")
-st.dataframe(df_filtered.head(20))
+st.dataframe(df_filtered.iloc[:20])
 
 # -------------------------------
 # End of Dashboard
@@ -0,0 +1,18 @@
+import streamlit as st
+import plotly.express as px
+
+# Cached Plotly figure builders shared by the dashboards. They take the small
+# aggregated values as tuples and return the figure as a dict, so reruns with
+# unchanged aggregates skip rebuilding the figure.
+
+@st.cache_data
+def build_pie(values, names, title, hole=None):
+    return px.pie(values=list(values), names=list(names), title=title, hole=hole).to_dict()
+
+@st.cache_data
+def build_bar(x, y, title, labels=None):
+    return px.bar(x=list(x), y=list(y), title=title, labels=labels).to_dict()
+
+@st.cache_data
+def build_line(x, y, title, labels=None):
+    return px.line(x=list(x), y=list(y), title=title, labels=labels).to_dict()
@@ -0,0 +1,76 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import datetime
+
+# Shared data loading for the dashboards (Sample02.py, main.py, sample1.py).
+# Each runs as its own `streamlit run` process, so the cache is persisted to
+# disk: whichever app loads first parses the CSV, the others read the pickle.
+
+# Customer age bins: [0, 30) -> '18-30', [30, 45) -> '31-45', ... ; missing ages -> 'Unknown'
+AGE_EDGES = np.array([0, 30, 45, 60, 100], dtype=np.int16)
+AGE_LABELS = ['Unknown', '18-30', '31-45', '46-60', '60+']
+
+@st.cache_data(persist="disk")
+def load_data():
+    # Read the CSV file (price stays float64 so revenue sums are exact to the cent)
+    df = pd.read_csv(
+        "orders_dataset.csv",
+        engine="pyarrow",
+        dtype={
+            'returnShipment': 'int8',
+            'state': 'category',
+            'color': 'category',
+            'size': 'category'
+        }
+    )
+    
+    # Convert date columns ('?' marks missing dates)
+    date_formats = {
+        'orderDate': '%d-%m-%Y',
+        'deliveryDate': '%Y-%m-%d',
+        'dateOfBirth': '%Y-%m-%d',
+        'creationDate': '%d-%m-%Y'
+    }
+    for col, fmt in date_formats.items():
+        df[col] = pd.to_datetime(df[col], format=fmt, errors='coerce')
+    
+    # Create additional useful columns
+    df['order_year_month'] = df['orderDate'].dt.to_period('M').astype(str).astype('category')
+    df['order_month'] = df['orderDate'].dt.month.astype('Int8')
+    df['delivery_delay'] = (df['deliveryDate'] - df['orderDate']).dt.days.astype('Int16')
+    
+    # Calculate customer age
+    dob = df['dateOfBirth']
+    today = datetime.now()
+    # Compare (month, day) as a single MMDD integer: one extraction per field, one comparison
+    birthday = dob.dt.month.to_numpy() * 100 + dob.dt.day.to_numpy()
+    before_birthday = birthday > today.month * 100 + today.day
+    df['customer_age'] = pd.Series(today.year - dob.dt.year.to_numpy() - before_birthday, index=df.index).astype('Int16')
+    
+    # Handle missing values as an extra category, filling on the codes
+    for c in ['state', 'color', 'size']:
+        if df[c].isna().any():
+            if 'Unknown' not in df[c].cat.categories:
+                df[c] = df[c].cat.add_categories('Unknown')
+            df[c] = df[c].fillna('Unknown')
+    
+    df['manufacturerID'] = df['manufacturerID'].astype('category')
+    
+    # Filter options are fixed once loaded
+    opts = {
+        'states': tuple(df['state'].cat.categories),
+        'months': tuple(sorted(df['order_year_month'].cat.categories)),
+        'colors': tuple(df['color'].cat.categories),
+        'sizes': tuple(df['size'].cat.categories)
+    }
+    
+    return df, opts
+
+def age_groups(ages):
+    # Missing ages become -1, which sorts before the first edge into 'Unknown'
+    values = ages.fillna(-1).to_numpy(dtype=np.int16)
+    codes = np.searchsorted(AGE_EDGES, values, side='right')
+    # Out-of-range ages stay uncategorized, as with pd.cut
+    codes[(values < -1) | (values >= AGE_EDGES[-1])] = -1
+    return pd.Series(pd.Categorical.from_codes(codes, categories=AGE_LABELS), index=ages.index)
@@ -1,49 +1,41 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 import plotly.graph_objs as go
-from datetime import datetime
+from preprocessing import load_data, age_groups
+from charts import build_pie, build_bar, build_line
 
 # Set page config
 st.set_page_config(page_title="Comprehensive Orders Analysis", layout="wide")
 
-# Load and preprocess data
-@st.cache_data
-def load_data():
-    # Read the CSV file
-    df = pd.read_csv("orders_dataset.csv")
-    
-    # Convert date columns with robust error handling
-    date_columns = ['orderDate', 'deliveryDate', 'dateOfBirth', 'creationDate']
-    for col in date_columns:
-        df[col] = pd.to_datetime(df[col], format='%d-%m-%Y', errors='coerce')
-        if col == 'deliveryDate':
-            df[col] = pd.to_datetime(df[col], format='%Y-%m-%d', errors='coerce')
-    
-    # Calculate delivery delay with error handling
-    df['delivery_delay'] = (df['deliveryDate'] - df['orderDate']).dt.days
-    df['delivery_delay'] = df['delivery_delay'].fillna('Unknown')
-    
-    # Calculate customer age
-    def calculate_age(born):
-        if pd.isnull(born):
-            return None
-        today = datetime.now()
-        try:
-            age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
-            return age
-        except:
-            return None
-    
-    df['customer_age'] = df['dateOfBirth'].apply(calculate_age)
-    
-    # Additional preprocessing
-    df['order_year_month'] = df['orderDate'].dt.to_period('M')
-    
-    return df
-
 # Load the data
-df = load_data()
+df, opts = load_data()
+
+# Filter dataframe, cached per filter selection as a shared, read-only frame
+@st.cache_resource(max_entries=16)
+def filter_df(states_t, months_t):
+    # An empty selection on any filter matches nothing
+    if not (states_t and months_t):
+        return df.iloc[0:0]
+    mask = (
+        df['state'].isin(states_t) &
+        df['order_year_month'].isin(months_t)
+    )
+    return df.loc[mask]
+
+# Compute chart aggregates in one pass per filter selection
+@st.cache_data(max_entries=16)
+def compute_aggregates(states_t, months_t):
+    df_filtered = filter_df(states_t, months_t)
+    # Handle cases with '?' in delivery date
+    df_delivery = df_filtered[df_filtered['deliveryDate'].notna()]
+    
+    return {
+        'color_orders': df_filtered.groupby('color', observed=True).size().sort_values(ascending=False),
+        'size_orders': df_filtered.groupby('size', observed=True).size().sort_values(ascending=False),
+        'manufacturer_revenue': df_filtered.groupby('manufacturerID', observed=True)['price'].sum().sort_values(ascending=False),
+        'delivery_performance': df_delivery.groupby('order_month')['delivery_delay'].mean(),
+        'return_rate_by_state': df_filtered.groupby('state', observed=True)['returnShipment'].mean() * 100,
+        'age_distribution': age_groups(df_filtered['customer_age']).value_counts()
+    }
 
 def main():
     # Sidebar for filters
@@ -53,25 +45,24 @@ def main():
     try:
         selected_states = st.sidebar.multiselect(
             "Select States", 
-            options=df['state'].dropna().unique(),
-            default=df['state'].dropna().unique()
+            options=opts['states'],
+            default=opts['states']
         )
         
         selected_months = st.sidebar.multiselect(
             "Select Months", 
-            options=sorted(df['order_year_month'].astype(str).unique()),
-            default=[df['order_year_month'].astype(str).max()]
+            options=opts['months'],
+            default=[opts['months'][-1]]
         )
     except Exception as e:
         st.sidebar.error(f"Error in filter selection: {e}")
-        selected_states = df['state'].dropna().unique()
-        selected_months = [df['order_year_month'].astype(str).max()]
+        selected_states = opts['states']
+        selected_months = [opts['months'][-1]]
     
     # Filter dataframe
-    df_filtered = df[
-        (df['state'].isin(selected_states)) & 
-        (df['order_year_month'].astype(str).isin(selected_months))
-    ]
+    filter_key = (tuple(sorted(selected_states)), tuple(sorted(selected_months)))
+    df_filtered = filter_df(*filter_key)
+    aggs = compute_aggregates(*filter_key)
     
     # Dashboard Title
     st.title("🛍️ Comprehensive Orders Analysis")
@@ -94,6 +85,10 @@ def main():
     except Exception as e:
         st.error(f"Error calculating key metrics: {e}")
     
+    if df_filtered.empty:
+        st.warning("No orders match the selected filters.")
+        return
+    
     # Visualization Section
     st.header("📈 Detailed Insights")
     
@@ -104,13 +99,13 @@ def main():
         # Order Distribution by Color
         st.subheader("Orders by Color")
         try:
-            color_orders = df_filtered['color'].value_counts()
-            fig_color = px.pie(
-                values=color_orders.values, 
-                names=color_orders.index, 
+            color_orders = aggs['color_orders']
+            fig_color = build_pie(
+                values=tuple(color_orders.values), 
+                names=tuple(color_orders.index), 
                 title="Color Distribution"
             )
-            st.plotly_chart(fig_color, use_container_width=True)
+            st.plotly_chart(go.Figure(fig_color), use_container_width=True)
         except Exception as e:
             st.error(f"Error creating color distribution chart: {e}")
     
@@ -118,14 +113,14 @@ def main():
         # Order Distribution by Size
         st.subheader("Orders by Size")
         try:
-            size_orders = df_filtered['size'].value_counts()
-            fig_size = px.bar(
-                x=size_orders.index, 
-                y=size_orders.values, 
+            size_orders = aggs['size_orders']
+            fig_size = build_bar(
+                x=tuple(size_orders.index), 
+                y=tuple(size_orders.values), 
                 title="Size Distribution",
                 labels={'x':'Size', 'y':'Number of Orders'}
             )
-            st.plotly_chart(fig_size, use_container_width=True)
+            st.plotly_chart(go.Figure(fig_size), use_container_width=True)
         except Exception as e:
             st.error(f"Error creating size distribution chart: {e}")
     
@@ -136,14 +131,14 @@ def main():
         # Revenue by Manufacturer
         st.subheader("Revenue by Manufacturer")
         try:
-            manufacturer_revenue = df_filtered.groupby('manufacturerID')['price'].sum().sort_values(ascending=False)
-            fig_manufacturer = px.bar(
-                x=manufacturer_revenue.index, 
-                y=manufacturer_revenue.values, 
+            manufacturer_revenue = aggs['manufacturer_revenue']
+            fig_manufacturer = build_bar(
+                x=tuple(manufacturer_revenue.index), 
+                y=tuple(manufacturer_revenue.values), 
                 title="Total Revenue by Manufacturer",
                 labels={'x':'Manufacturer ID', 'y':'Total Revenue'}
             )
-            st.plotly_chart(fig_manufacturer, use_container_width=True)
+            st.plotly_chart(go.Figure(fig_manufacturer), use_container_width=True)
         except Exception as e:
             st.error(f"Error creating manufacturer revenue chart: {e}")
     
@@ -151,16 +146,14 @@ def main():
         # Delivery Performance
         st.subheader("Delivery Performance")
         try:
-            # Handle cases with '?' in delivery date
-            df_delivery = df_filtered[df_filtered['deliveryDate'].notna()]
-            delivery_performance = df_delivery.groupby(df_delivery['orderDate'].dt.month)['delivery_delay'].mean()
-            fig_delivery = px.line(
-                x=delivery_performance.index, 
-                y=delivery_performance.values, 
+            delivery_performance = aggs['delivery_performance']
+            fig_delivery = build_line(
+                x=tuple(delivery_performance.index), 
+                y=tuple(delivery_performance.values), 
                 title="Average Delivery Delay by Month",
                 labels={'x':'Month', 'y':'Average Delay (Days)'}
             )
-            st.plotly_chart(fig_delivery, use_container_width=True)
+            st.plotly_chart(go.Figure(fig_delivery), use_container_width=True)
         except Exception as e:
             st.error(f"Error creating delivery performance chart: {e}")
     
@@ -170,39 +163,28 @@ def main():
     # Return Rate Analysis
     st.subheader("Return Rate Analysis")
     try:
-        return_rate_by_state = df_filtered.groupby('state')['returnShipment'].mean() * 100
-        fig_returns = px.bar(
-            x=return_rate_by_state.index, 
-            y=return_rate_by_state.values, 
+        return_rate_by_state = aggs['return_rate_by_state']
+        fig_returns = build_bar(
+            x=tuple(return_rate_by_state.index), 
+            y=tuple(return_rate_by_state.values), 
             title="Return Rate by State",
             labels={'x':'State', 'y':'Return Rate (%)'}
         )
-        st.plotly_chart(fig_returns, use_container_width=True)
+        st.plotly_chart(go.Figure(fig_returns), use_container_width=True)
     except Exception as e:
         st.error(f"Error creating return rate analysis: {e}")
     
     # Customer Age Distribution
     st.subheader("Customer Age Distribution")
     try:
-        # Safely handle age calculation and binning
-        age_bins = [0, 30, 45, 60, 100]
-        age_labels = ['18-30', '31-45', '46-60', '60+']
-        
-        df_filtered['age_group'] = pd.cut(
-            df_filtered['customer_age'].fillna(-1), 
-            bins=[-1] + age_bins, 
-            labels=['Unknown'] + age_labels, 
-            right=False
-        )
-        
-        age_distribution = df_filtered['age_group'].value_counts()
+        age_distribution = aggs['age_distribution']
         
-        fig_age = px.pie(
-            values=age_distribution.values, 
-            names=age_distribution.index, 
+        fig_age = build_pie(
+            values=tuple(age_distribution.values), 
+            names=tuple(age_distribution.index), 
             title="Customer Age Distribution"
         )
-        st.plotly_chart(fig_age, use_container_width=True)
+        st.plotly_chart(go.Figure(fig_age), use_container_width=True)
     except Exception as e:
         st.error(f"Error creating age distribution chart: {e}")
     
@@ -224,17 +206,17 @@ def main():
         with col1:
             min_price = st.number_input("Minimum Price", min_value=0.0, value=0.0)
         with col2:
-            max_price = st.number_input("Maximum Price", min_value=0.0, value=df_filtered['price'].max())
+            max_price = st.number_input("Maximum Price", min_value=0.0, value=float(df_filtered['price'].max()))
         with col3:
             show_returns_only = st.checkbox("Show Returns Only")
         
-        # Apply additional filtering
-        df_table = df_filtered[
-            (df_filtered['price'].between(min_price, max_price)) & 
-            (df_filtered['returnShipment'] == 1 if show_returns_only else True)
-        ]
+        # Apply additional filtering, materializing only the first 20 matching rows
+        mask = df_filtered['price'].between(min_price, max_price)
+        if show_returns_only:
+            mask &= df_filtered['returnShipment'] == 1
+        df_table = df_filtered.loc[mask[mask].index[:20], display_columns]
         
-        st.dataframe(df_table[display_columns])
+        st.dataframe(df_table)
     except Exception as e:
         st.error(f"Error creating detailed order table: {e}")
 